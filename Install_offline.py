@@ -1,8 +1,8 @@
 # install_offline.py
 import os
+import re
 import subprocess
-import shutil
-import glob
+import venv
 from pathlib import Path
 
 # Константы
@@ -11,81 +11,101 @@ MODELS_DIR = Path("models")
 REQUIREMENTS_FILE = "requirements/requirements.txt"
 MODEL_NAME = "intfloat/multilingual-e5-large"
 MODEL_TARGET_DIR = Path("models", "multilingual-e5-large")
+# Строки вида "name[extras]==version", комментарии в конце строки отбрасываются
+REQUIREMENT_RE = re.compile(r'^[ \t]*([A-Za-z0-9_.\-]+(?:\[[^\]]*\])?==[^\s#]+)', re.M)
 
 def create_venv():
     """Создает виртуальное окружение"""
-    if VENv_DIR.exists():
-        print(f"Удаление существующего виртуального окружения {VENv_DIR}")
-        shutil.rmtree(VENv_DIR)
     print(f"Создание нового виртуального окружения в {VENv_DIR}")
-    subprocess.run([os.sys.executable, "-m", "venv", str(VENv_DIR)], check=True)
+    # clear=True удаляет существующее окружение; symlinks избавляет от копии python на POSIX
+    builder = venv.EnvBuilder(with_pip=True, clear=True, symlinks=(os.name != 'nt'))
+    builder.create(str(VENv_DIR))
 
 def parse_requirements():
     """Парсит requirements.txt и возвращает список пакетов в порядке установки"""
-    packages = []
-    with open(REQUIREMENTS_FILE, 'r') as f:
-        for line in f:
-            line = line.strip()
-            # Пропуск комментариев и пустых строк
-            if not line or line.startswith('#') or line.startswith('--'):
-                continue
-            # Остановка после тестовых зависимостей
-            if line.startswith('# Тестирование'):
-                break
-            if '==' in line:
-                packages.append(line)
-    return packages
-
-def find_wheel(package, models_dir):
-    """Находит .whl файл для пакета в директории models_dir"""
+    data = Path(REQUIREMENTS_FILE).read_text(encoding='utf-8')
+    # Остановка перед тестовыми зависимостями
+    cut = data.find('# Тестирование')
+    if cut != -1:
+        data = data[:cut]
+    return REQUIREMENT_RE.findall(data)
+
+def normalize_dist_name(name):
+    """Нормализует имя дистрибутива так, как оно записывается в имени .whl"""
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+def index_wheels(models_dir):
+    """Один раз читает директорию models_dir и индексирует .whl файлы по имени и версии"""
+    # Имя файла по PEP 427: {distribution}-{version}(-{build})?-{python}-{abi}-{platform}.whl
+    wheel_index = {}
+    for entry in os.scandir(models_dir):
+        if not entry.name.lower().endswith('.whl'):
+            continue
+        parts = entry.name.split('-')
+        if len(parts) < 5:
+            continue
+        name, version = normalize_dist_name(parts[0]), parts[1].lower()
+        public_version = version.split('+', 1)[0]
+        if version == public_version:
+            wheel_index[(name, version)] = entry.path
+        else:
+            wheel_index.setdefault((name, version), entry.path)
+            # По PEP 440 пин ==2.1.2 совпадает и с 2.1.2+cpu; колесо без локальной метки приоритетнее
+            wheel_index.setdefault((name, public_version), entry.path)
+    return wheel_index
+
+def find_wheel(package, wheel_index):
+    """Находит .whl файл для пакета в заранее построенном индексе"""
     package_name, version = package.split('==', 1)
-    # Пытаемся найти соответствующий .whl файл
-    patterns = [
-        f"{package_name.replace('-', '_').lower()}*{version}*.whl",
-        f"{package_name.replace('_', '-').lower()}*{version}*.whl"
-    ]
-    
-    for pattern in patterns:
-        wheel_files = glob.glob(str(models_dir / pattern))
-        if wheel_files:
-            return wheel_files[0]
-    
-    raise FileNotFoundError(f"Не найден .whl файл для {package}")
-
-def install_packages(packages, models_dir, pip_path):
-    """Устанавливает пакеты в виртуальное окружение"""
-    for package in packages:
-        try:
-            wheel_file = find_wheel(package, models_dir)
-            print(f"Установка {package} из {wheel_file}")
-            subprocess.run([
-                pip_path, "install", "--no-index", "--find-links", str(models_dir),
-                str(wheel_file)
-            ], check=True)
-        except Exception as e:
-            print(f"Ошибка при установке {package}: {e}")
-            raise
+    # Экстры вида uvicorn[standard] не входят в имя файла
+    package_name = package_name.split('[', 1)[0]
+    wheel_file = wheel_index.get((normalize_dist_name(package_name), version.lower()))
+    if wheel_file is None:
+        raise FileNotFoundError(f"Не найден .whl файл для {package}")
+    return wheel_file
+
+def install_packages(packages, models_dir, pip_path, wheel_index):
+    """Устанавливает пакеты в виртуальное окружение одним вызовом pip"""
+    try:
+        wheels = [find_wheel(package, wheel_index) for package in packages]
+        print(f"Установка {len(wheels)} пакетов из {models_dir}")
+        # Один процесс pip вместо отдельного запуска на каждый пакет;
+        # байткод компилируется отдельно в compile_bytecode
+        subprocess.run([
+            str(pip_path), "install", "--no-index", "--no-compile",
+            "--find-links", str(models_dir),
+            *wheels
+        ], check=True)
+    except Exception as e:
+        print(f"Ошибка при установке пакетов: {e}")
+        raise
+
+def compile_bytecode(python_path):
+    """Компилирует .pyc для установленных пакетов параллельно"""
+    print("Компиляция байткода")
+    subprocess.run([
+        str(python_path), "-m", "compileall", "-q", "-j", "0", str(VENv_DIR)
+    ], check=True)
 
 def install_model(models_dir):
-    """Копирует модель в целевую директорию"""
+    """Проверяет, что модель лежит в целевой директории.
+    Пакет поставляется с моделью уже в MODEL_TARGET_DIR, поэтому копировать нечего"""
     model_source = models_dir / MODEL_NAME.split("/")[1]
-    if model_source.exists():
-        print(f"Копирование модели {MODEL_NAME} в {MODEL_TARGET_DIR}")
-        if MODEL_TARGET_DIR.exists():
-            shutil.rmtree(MODEL_TARGET_DIR)
-        shutil.copytree(model_source, MODEL_TARGET_DIR)
-    else:
+    if not model_source.exists():
         raise FileNotFoundError(f"Модель {MODEL_NAME} не найдена в {models_dir}")
+    print(f"Модель {MODEL_NAME} находится в {MODEL_TARGET_DIR}")
 
 def main():
     # Создаем виртуальное окружение
     create_venv()
 
-    # Получаем путь к pip в виртуальном окружении
+    # Получаем пути к pip и python в виртуальном окружении
     if os.name == 'nt':
         pip_path = VENv_DIR / "Scripts" / "pip.exe"
+        python_path = VENv_DIR / "Scripts" / "python.exe"
     else:
         pip_path = VENv_DIR / "bin" / "pip"
+        python_path = VENv_DIR / "bin" / "python"
 
     # Проверяем существование директории с пакетами
     if not MODELS_DIR.exists():
@@ -96,7 +116,9 @@ def main():
     print(f"Найдено {len(packages)} пакетов для установки")
 
     # Устанавливаем пакеты
-    install_packages(packages, MODELS_DIR, pip_path)
+    wheel_index = index_wheels(MODELS_DIR)
+    install_packages(packages, MODELS_DIR, pip_path, wheel_index)
+    compile_bytecode(python_path)
 
     # Устанавливаем модель
     install_model(MODELS_DIR)
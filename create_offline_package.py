@@ -26,26 +26,25 @@ DEPENDENCIES = [
     "sentence-transformers==2.2.2",
     "transformers==4.36.2",
     "torch==2.1.2",
-    "nltk==3.8.1",
     "scikit-learn==1.3.2",
     "pyyaml==6.0.1",
     "tqdm==4.66.1",
+    "orjson==3.9.10",
     "tenacity==8.2.3",
     "python-multipart==0.0.6"
 ]
 
 def download_packages():
-    """Скачивает все пакеты в формате .whl"""
-    for package in DEPENDENCIES:
-        subprocess.run([
-            "pip", "download",
-            "--dest", str(MODELS_DIR),
-            package
-        ])
-
-def download_model():
-    """Скачивает модель multilingual-e5-large"""
+    """Скачивает все пакеты в формате .whl одним вызовом pip (один проход резолвера)"""
     subprocess.run([
+        "pip", "download",
+        "--dest", str(MODELS_DIR),
+        *DEPENDENCIES
+    ])
+
+def download_model() -> subprocess.Popen:
+    """Запускает скачивание модели multilingual-e5-large в фоне"""
+    return subprocess.Popen([
         "huggingface-cli", "download",
         "intfloat/multilingual-e5-large",
         "--revision", "main",
@@ -53,5 +52,7 @@ def download_model():
     ])
 
 if __name__ == "__main__":
+    # Модель и пакеты скачиваются параллельно
+    model_download = download_model()
     download_packages()
-    download_model()
\ No newline at end of file
+    model_download.wait()
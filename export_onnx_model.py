@@ -0,0 +1,41 @@
+# export_onnx_model.py
+import json
+import subprocess
+from pathlib import Path
+from utils.helpers import load_config
+
+# Экспорт модели эмбеддингов в ONNX и INT8-квантование (требуется optimum[onnxruntime])
+config = load_config()
+MODEL_NAME = config['processing']['embedding_model']
+ONNX_DIR = Path(config['processing'].get('onnx_model_dir', 'models/onnx'))
+
+def export_model():
+    """Экспортирует модель в ONNX"""
+    subprocess.run([
+        "optimum-cli", "export", "onnx",
+        "--model", MODEL_NAME,
+        "--task", "feature-extraction",
+        str(ONNX_DIR)
+    ], check=True)
+
+def quantize_model():
+    """Динамическое INT8-квантование (model_quantized.onnx)"""
+    subprocess.run([
+        "optimum-cli", "onnxruntime", "quantize",
+        "--onnx_model", str(ONNX_DIR),
+        "--avx512_vnni",
+        "-o", str(ONNX_DIR)
+    ], check=True)
+
+def save_sentence_config():
+    """Сохраняет max_seq_length модели: без него токенизатор обрезал бы текст по 512 токенам,
+    и векторы ONNX не совпадали бы с векторами SentenceTransformer"""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    with open(ONNX_DIR / "sentence_bert_config.json", 'w', encoding='utf-8') as f:
+        json.dump({"max_seq_length": model.max_seq_length}, f)
+
+if __name__ == "__main__":
+    export_model()
+    quantize_model()
+    save_sentence_config()
@@ -1,12 +1,11 @@
-import asyncio
 from contextlib import asynccontextmanager
 from typing import AsyncIterator
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance
-from utils.helpers import load_config, clear_directory, setup_logging
+from utils.helpers import load_config, clear_directory, setup_logging, create_dir
+from utils.vector_store import create_qdrant_client, recreate_collection
 import logging
 import os
 
@@ -20,19 +19,17 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     setup_logging(config['paths']['log_file'])
     logger = logging.getLogger(__name__)
 
+    # Рабочие директории создаются один раз при старте
+    for dir_key in ('data_dir', 'output_dir', 'index_dir'):
+        create_dir(config['paths'][dir_key])
+
     # Инициализация Qdrant
-    qdrant_client = QdrantClient(
-        host=config['qdrant']['host'],
-        port=config['qdrant']['port'],
-        timeout=10
-    )
+    qdrant_client = create_qdrant_client(config, timeout=10)
     app.state.qdrant_client = qdrant_client
     
     # Инициализация модели эмбеддингов
-    from sentence_transformers import SentenceTransformer
-    app.state.embedding_model = SentenceTransformer(
-        config['processing']['embedding_model']
-    )
+    from utils.embeddings import load_embedding_model
+    app.state.embedding_model = load_embedding_model(config)
     
     # Очистка директорий при старте
     clear_directory(config['paths']['data_dir'])
@@ -42,22 +39,13 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     try:
         qdrant_client.get_collection(config['qdrant']['collection_name'])
     except Exception:
-        qdrant_client.recreate_collection(
-            collection_name=config['qdrant']['collection_name'],
-            vectors_config=VectorParams(
-                size=config['qdrant']['vector_size'],
-                distance=Distance.COSINE
-            )
-        )
+        recreate_collection(qdrant_client, config)
     
     logger.info("Сервис запущен, инициализация завершена")
     
     # Запуск фоновой задачи обработки
-    async def process_files_background():
-        from process import process_uploaded_files
-        await process_uploaded_files()
-    
-    asyncio.create_task(process_files_background())
+    from process import start_background_processing
+    start_background_processing()
     
     from utils.context_builder import ContextBuilder
     app.state.context_builder = ContextBuilder(config)
@@ -71,7 +59,36 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
 # Создание FastAPI приложения
 app = FastAPI(
     title="RAG Document Assistant",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+class UploadSizeLimitMiddleware:
+    """Отклоняет загрузки больше лимита по заголовку Content-Length до чтения тела запроса.
+    Чистый ASGI: остальные запросы (статика, поиск, чат) проходят без обертки BaseHTTPMiddleware"""
+
+    def __init__(self, app, max_upload_size_mb: int):
+        self.app = app
+        self.max_upload_size_mb = max_upload_size_mb
+        self.max_bytes = max_upload_size_mb * 1024 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != "/upload":
+            await self.app(scope, receive, send)
+            return
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = ORJSONResponse(
+                status_code=413,
+                content={"detail": f"Размер загрузки превышает {self.max_upload_size_mb} МБ"}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_upload_size_mb=load_config()['processing'].get('max_upload_size_mb', 200)
 )
 
 # Подключение статических файлов
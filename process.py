@@ -12,6 +12,9 @@ from utils.ingest import main as ingest_main
 logger = logging.getLogger(__name__)
 config = load_config()
 
+# Единственная задача фоновой обработки на процесс
+_background_task = None
+
 def clear_data_directory(data_dir: str):
     """Очищает каталог data после обработки"""
     try:
@@ -37,7 +40,7 @@ def main() -> dict:
     
     try:
         # Параллельная обработка файлов
-        all_chunks = parallel_process(config)
+        all_chunks = asyncio.run(parallel_process(config))
         if not all_chunks:
             logging.error("No files were processed")
             return {"error": "No files processed"}
@@ -45,6 +48,9 @@ def main() -> dict:
         # Инициализация процессора файлов
         processor = FileProcessor(config)
         processed_files = []
+
+        # Векторизация чанков всех файлов одним вызовом: батчи заполняются полностью
+        processor.vectorize_chunks([chunk for chunks in all_chunks.values() for chunk in chunks])
         
         # Сохранение результатов
         for file_path, chunks in tqdm(all_chunks.items(), desc="Сохранение чанков"):
@@ -55,7 +61,7 @@ def main() -> dict:
                 output_dir, 
                 f"{os.path.splitext(os.path.basename(file_path))[0]}.json"
             )
-            processor.save_chunks(chunks, output_file)
+            processor.save_chunks(chunks, output_file, vectorize=False)
             processed_files.append(file_path)
             logging.info(f"Processed {file_path} -> {len(chunks)} chunks")
         
@@ -79,7 +85,9 @@ def main() -> dict:
 async def process_uploaded_files():
     """Фоновая обработка загруженных файлов"""
     try:
-        processor = FileProcessor(config)
+        # Загрузка моделей, разбор файлов и векторизация выполняются в потоках,
+        # чтобы не блокировать event loop веб-сервера
+        processor = await asyncio.to_thread(FileProcessor, config)
         data_dir = config['paths']['data_dir']
         output_dir = config['paths']['output_dir']
         
@@ -91,17 +99,30 @@ async def process_uploaded_files():
                 await asyncio.sleep(5)  # Проверяем каждые 5 секунд
                 continue
             
+            file_chunks = {}
             for file in files:
                 file_path = os.path.join(data_dir, file)
                 try:
                     logger.info(f"Начата обработка: {file}")
-                    chunks = processor.process_file(file_path)
-                    
+                    file_chunks[file] = await asyncio.to_thread(processor.process_file, file_path)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки {file}: {str(e)}")
+
+            # Векторизация чанков всех файлов за проход одним вызовом:
+            # мелкие документы не порождают отдельных неполных батчей
+            await asyncio.to_thread(
+                processor.vectorize_chunks,
+                [chunk for chunks in file_chunks.values() for chunk in chunks]
+            )
+
+            for file, chunks in file_chunks.items():
+                file_path = os.path.join(data_dir, file)
+                try:
                     output_file = os.path.join(
                         output_dir, 
                         f"{os.path.splitext(file)[0]}.json"
                     )
-                    processor.save_chunks(chunks, output_file)
+                    await asyncio.to_thread(processor.save_chunks, chunks, output_file, False)
                     os.remove(file_path)  # Удаляем обработанный файл
                     logger.info(f"Файл обработан: {file}")
                     
@@ -109,12 +130,19 @@ async def process_uploaded_files():
                     logger.error(f"Ошибка обработки {file}: {str(e)}")
             
             # Загрузка в Qdrant
-            loaded = ingest_main()
+            loaded = await asyncio.to_thread(ingest_main)
             logger.info(f"Загружено в Qdrant: {loaded} чанков")
             
     except Exception as e:
         logger.critical(f"Фоновая обработка прервана: {str(e)}")
 
+def start_background_processing() -> asyncio.Task:
+    """Запускает фоновую обработку, если она еще не запущена"""
+    global _background_task
+    if _background_task is None or _background_task.done():
+        _background_task = asyncio.create_task(process_uploaded_files())
+    return _background_task
+
 
 
 
@@ -1,15 +1,14 @@
 import asyncio
 from fastapi import APIRouter, Request, Form, UploadFile, File, HTTPException, Body
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
 from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue, PointIdsList, VectorParams, Distance
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import Filter, FieldCondition, MatchValue, PointIdsList
 from utils.helpers import load_config, normalize_text, generate_unique_id
-from utils.context_builder import ContextBuilder
+from utils.vector_store import recreate_collection
 from utils.llm_client import llm_client
+from process import start_background_processing
 import os
-import shutil
 import uuid
 from pathlib import Path
 import logging
@@ -20,21 +19,15 @@ from typing import Dict, List, Optional, Any, Union
 from collections import defaultdict
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 config = load_config()
 templates = Jinja2Templates(directory="web/templates")
 
-# Инициализация клиентов
-qdrant_client = QdrantClient(
-    host=config['qdrant']['host'],
-    port=config['qdrant']['port'],
-    timeout=10
-)
-embedding_model = SentenceTransformer(config['processing']['embedding_model'])
-context_builder = ContextBuilder(config)
 logger = logging.getLogger(__name__)
 
-async def get_collection_info() -> Dict:
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 МБ
+
+async def get_collection_info(qdrant_client: QdrantClient) -> Dict:
     """Получение информации о коллекции"""
     collection = qdrant_client.get_collection(config['qdrant']['collection_name'])
     count = qdrant_client.count(config['qdrant']['collection_name'])
@@ -45,7 +38,7 @@ async def get_collection_info() -> Dict:
         "points_count": count.count
     }
 
-async def get_detailed_stats() -> Dict:
+async def get_detailed_stats(qdrant_client: QdrantClient) -> Dict:
     """Получение детальной статистики по документам"""
     records, _ = qdrant_client.scroll(
         collection_name=config['qdrant']['collection_name'],
@@ -151,8 +144,9 @@ async def get_detailed_stats() -> Dict:
 async def dashboard(request: Request):
     """Главная страница с аналитикой"""
     try:
-        collection_info = await get_collection_info()
-        stats = await get_detailed_stats()
+        qdrant_client = request.app.state.qdrant_client
+        collection_info = await get_collection_info(qdrant_client)
+        stats = await get_detailed_stats(qdrant_client)
         
         return templates.TemplateResponse(
             "dashboard.html",
@@ -192,7 +186,7 @@ def _get_file_types_stats(global_index: Optional[Dict[str, Any]]) -> Dict[str, i
 async def documents_page(request: Request):
     """Страница управления документами"""
     try:
-        stats = await get_detailed_stats()
+        stats = await get_detailed_stats(request.app.state.qdrant_client)
         return templates.TemplateResponse(
             "documents.html",
             {
@@ -212,6 +206,7 @@ async def documents_page(request: Request):
 async def delete_document(request: Request, file_id: str = Form(...)):
     """Удаление документа"""
     try:
+        qdrant_client = request.app.state.qdrant_client
         # Фильтр для поиска точек по file_id
         filter_ = Filter(
             must=[
@@ -270,10 +265,12 @@ async def perform_search(request: Request, query: str = Form(...)):
     """Обработка поискового запроса"""
     try:
         # Векторизация запроса
-        query_embedding = embedding_model.encode(query).tolist()
+        query_embedding = (await asyncio.to_thread(
+            request.app.state.embedding_model.encode, query
+        )).tolist()
         
         # Поиск в Qdrant
-        results = qdrant_client.search(
+        results = request.app.state.qdrant_client.search(
             collection_name=config['qdrant']['collection_name'],
             query_vector=query_embedding,
             limit=5,
@@ -315,9 +312,13 @@ async def upload_page(request: Request):
 
 @router.post("/upload")
 async def upload_files(files: List[UploadFile] = File(...)):
+    # Файлы пишутся под временными именами (.part их не видит фоновая обработка)
+    # и переименовываются только после того, как весь запрос прошел проверки
+    pending = []
     try:
-        saved_files = []
         data_dir = config['paths']['data_dir']
+        max_file_size_mb = config['processing']['max_file_size_mb']
+        max_file_size = max_file_size_mb * 1024 * 1024
         
         for file in files:
             # Сохраняем оригинальное имя с добавлением UUID
@@ -326,25 +327,44 @@ async def upload_files(files: List[UploadFile] = File(...)):
             new_filename = f"{original_name}_{generate_unique_id()}{ext}"
             
             file_path = os.path.join(data_dir, new_filename)
+            temp_path = f"{file_path}.part"
+            pending.append((temp_path, file_path))
             
-            with open(file_path, "wb") as f:
-                shutil.copyfileobj(file.file, f)
+            # Копируем по частям, прерываясь сразу после превышения лимита
+            file_size = 0
+            with open(temp_path, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    if file_size > max_file_size:
+                        break
+                    f.write(chunk)
             
-            saved_files.append({
-                "original_name": file.filename,
-                "saved_as": new_filename
-            })
-            logger.info(f"Uploaded file: {new_filename}")
+            if file_size > max_file_size:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Файл {file.filename} превышает {max_file_size_mb} МБ"
+                )
+        
+        for temp_path, file_path in pending:
+            os.replace(temp_path, file_path)
+            logger.info(f"Uploaded file: {os.path.basename(file_path)}")
+        pending = []
         
-        # Запускаем обработку в фоне
-        from process import process_uploaded_files
-        asyncio.create_task(process_uploaded_files())
+        # Запускаем обработку в фоне, если она еще не идет
+        start_background_processing()
         
         # Перенаправляем на страницу документов
         return RedirectResponse(url="/documents", status_code=303)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # При ошибке удаляются все файлы запроса, а не только последний
+        for temp_path, _ in pending:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
 @router.get("/chat", response_class=HTMLResponse)
 async def chat_page(request: Request):
@@ -366,10 +386,11 @@ async def chat_with_document(request: Request, data: Dict = Body(...)):
         llm_config = config['llm']
 
         # Векторизация вопроса
-        question_embedding = request.app.state.embedding_model.encode(
+        question_embedding = (await asyncio.to_thread(
+            request.app.state.embedding_model.encode,
             question,
             normalize_embeddings=True
-        ).tolist()
+        )).tolist()
 
         # Поиск с параметрами из конфига
         search_results = request.app.state.qdrant_client.search(
@@ -402,10 +423,13 @@ async def chat_with_document(request: Request, data: Dict = Body(...)):
             context = "\n\n".join(context_chunks[:context_config['max_chunks']])
 
         # Логирование для отладки
-        logger.debug(f"Found {len(search_results)} fragments, using {min(len(search_results), context_config['max_chunks'])}")
+        logger.debug(
+            "Found %d fragments, using %d",
+            len(search_results), min(len(search_results), context_config['max_chunks'])
+        )
         
         if not context.strip():
-            return JSONResponse(
+            return ORJSONResponse(
                 content={"response": "Релевантная информация не найдена в документах"},
                 status_code=404
             )
@@ -424,20 +448,15 @@ async def chat_with_document(request: Request, data: Dict = Body(...)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.post("/purge")
-async def purge_database():
+async def purge_database(request: Request):
     """Очистка всей базы данных"""
     try:
+        qdrant_client = request.app.state.qdrant_client
         # Удаляем коллекцию
         qdrant_client.delete_collection(config['qdrant']['collection_name'])
         
         # Пересоздаем пустую коллекцию
-        qdrant_client.recreate_collection(
-            collection_name=config['qdrant']['collection_name'],
-            vectors_config=VectorParams(
-                size=config['qdrant']['vector_size'],
-                distance=Distance.COSINE
-            )
-        )
+        recreate_collection(qdrant_client, config)
         
         # Очищаем директории
         data_dir = config['paths']['data_dir']
@@ -449,7 +468,7 @@ async def purge_database():
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=200,
             content={"message": "База данных успешно очищена"}
         )
@@ -458,10 +477,10 @@ async def purge_database():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/debug/check_data")
-async def debug_check_data():
+async def debug_check_data(request: Request):
     """Проверка первых 3 записей в Qdrant"""
     try:
-        records = qdrant_client.scroll(
+        records = request.app.state.qdrant_client.scroll(
             collection_name=config['qdrant']['collection_name'],
             limit=3,
             with_payload=True
@@ -475,7 +494,7 @@ async def debug_check_data():
                 "vector": record.vector[:5] + ["..."] if record.vector else None
             })
         
-        return JSONResponse(content=formatted_records)
+        return ORJSONResponse(content=formatted_records)
     except Exception as e:
         logger.error(f"Debug check error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
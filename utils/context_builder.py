@@ -3,21 +3,19 @@ import re
 import numpy as np
 from typing import List, Dict, Any
 from sklearn.metrics.pairwise import cosine_similarity
-from nltk.corpus import stopwords
-import nltk
+from spacy.lang.ru.stop_words import STOP_WORDS
 from utils.helpers import setup_logging, load_config
 
 config = load_config()
 setup_logging(config['paths']['log_file'])
 logger = logging.getLogger(__name__)
 
-# Загрузка стоп-слов при импорте
-try:
-    nltk.download('stopwords', quiet=True)
-    STOPWORDS_RU = set(stopwords.words('russian'))
-except Exception as e:
-    logging.warning(f"Не удалось загрузить стоп-слова: {str(e)}")
-    STOPWORDS_RU = set()
+# Стоп-слова из spaCy: поставляются с пакетом, загрузка из сети не нужна
+STOPWORDS_RU = frozenset(STOP_WORDS)
+
+# Регулярные выражения очистки текста компилируются один раз при импорте
+SPECIAL_CHARS_RE = re.compile(r'[^\w\s.,:;!?()-]')
+WHITESPACE_RE = re.compile(r'\s+')
 
 class ContextBuilder:
     def __init__(self, config: Dict[str, Any]):
@@ -100,23 +98,18 @@ class ContextBuilder:
         if len(results) <= 1:
             return results
             
-        # Получаем векторы документов, фильтруя NaN
-        doc_vectors = []
-        valid_results = []
-        
-        for r in results:
-            if hasattr(r, 'vector') and r.vector is not None:
-                # Проверяем на NaN
-                if not any(np.isnan(x) for x in r.vector):
-                    doc_vectors.append(np.array(r.vector))  # Convert to numpy array
-                    valid_results.append(r)
-        
-        if not doc_vectors:
+        # Векторы документов собираются в одну матрицу float32, строки с NaN отбрасываются
+        with_vectors = [r for r in results if getattr(r, 'vector', None) is not None]
+        if not with_vectors:
             return results[:self.max_chunks]
-        
-        # Преобразуем в numpy array и проверяем форму
-        doc_vectors = np.vstack(doc_vectors)  # Stack vectors into 2D array
-        query_embedding = np.array(query_embedding).reshape(1, -1)  # Ensure 2D array
+
+        doc_vectors = np.asarray([r.vector for r in with_vectors], dtype=np.float32)
+        valid = ~np.isnan(doc_vectors).any(axis=1)
+        if not valid.any():
+            return results[:self.max_chunks]
+        doc_vectors = doc_vectors[valid]
+        valid_results = [r for r, ok in zip(with_vectors, valid) if ok]
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
         
         # Сходство с запросом
         query_sim = cosine_similarity(query_embedding, doc_vectors)[0]
@@ -126,7 +119,7 @@ class ContextBuilder:
         
         # MMR выборка
         selected = []
-        remaining = list(range(len(results)))
+        remaining = list(range(len(valid_results)))
         
         # Первый документ - самый релевантный
         selected.append(np.argmax(query_sim))
@@ -146,7 +139,7 @@ class ContextBuilder:
             selected.append(best_idx)
             remaining.remove(best_idx)
         
-        return [results[i] for i in selected]
+        return [valid_results[i] for i in selected]
 
     def _clean_text(self, text: str) -> str:
         """
@@ -159,9 +152,9 @@ class ContextBuilder:
             Очищенный текст
         """
         # Удаление специальных символов
-        text = re.sub(r'[^\w\s.,:;!?()-]', ' ', text)
+        text = SPECIAL_CHARS_RE.sub(' ', text)
         # Удаление лишних пробелов
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = WHITESPACE_RE.sub(' ', text).strip()
         
         if not self.clean_stopwords:
             return text
@@ -0,0 +1,104 @@
+#utils/embeddings.py
+import os
+import json
+import logging
+import numpy as np
+from typing import List, Union
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model_quantized.onnx"
+
+
+class OnnxEmbeddingModel:
+    """Эмбеддинги через ONNX Runtime (INT8) с интерфейсом encode как у SentenceTransformer"""
+
+    def __init__(self, model_dir: str, file_name: str = ONNX_MODEL_FILE):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=file_name)
+        self.max_seq_length = self._read_max_seq_length(model_dir)
+
+    def _read_max_seq_length(self, model_dir: str) -> int:
+        """Длина обрезки как у SentenceTransformer (sentence_bert_config.json из export_onnx_model.py)"""
+        config_path = os.path.join(model_dir, "sentence_bert_config.json")
+        if os.path.isfile(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                max_seq_length = json.load(f).get('max_seq_length')
+            if max_seq_length:
+                return int(max_seq_length)
+        logger.warning(
+            f"sentence_bert_config.json not found in '{model_dir}', truncating at "
+            f"{self.tokenizer.model_max_length} tokens - vectors may differ from the torch backend"
+        )
+        return self.tokenizer.model_max_length
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Mean pooling по токенам, как в sentence-transformers"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # Сортировка по длине уменьшает паддинг внутри батча
+        order = np.argsort([-len(s) for s in sentences])
+        result = None
+        for start in range(0, len(sentences), batch_size):
+            batch_idx = order[start:start + batch_size]
+            inputs = self.tokenizer([sentences[i] for i in batch_idx],
+                                    padding=True, truncation=True, max_length=self.max_seq_length,
+                                    return_tensors="np")
+            token_embeddings = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if result is None:
+                result = np.empty((len(sentences), pooled.shape[1]), dtype=np.float32)
+            result[batch_idx] = pooled
+
+        if result is None:
+            return np.empty((0, 0), dtype=np.float32)
+        if normalize_embeddings:
+            result /= np.clip(np.linalg.norm(result, axis=1, keepdims=True), 1e-12, None)
+        return result[0] if single else result
+
+
+def load_embedding_model(config: dict):
+    """Загружает модель эмбеддингов согласно processing.embedding_backend (torch/onnx)"""
+    processing_cfg = config['processing']
+    backend = processing_cfg.get('embedding_backend', 'torch')
+
+    if backend == 'onnx':
+        model_dir = processing_cfg.get('onnx_model_dir', '')
+        if os.path.isfile(os.path.join(model_dir, ONNX_MODEL_FILE)):
+            try:
+                model = OnnxEmbeddingModel(model_dir)
+                logger.info(f"Embedding model loaded via ONNX Runtime: {model_dir}")
+                return model
+            except ImportError as e:
+                logger.warning(f"ONNX backend unavailable ({str(e)}), falling back to torch")
+        else:
+            logger.warning(f"ONNX model not found in '{model_dir}', falling back to torch")
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(
+        processing_cfg['embedding_model'],
+        device=processing_cfg['device']
+    )
+    if str(processing_cfg['device']).startswith('cuda'):
+        _optimize_for_gpu(model)
+    return model
+
+
+def _optimize_for_gpu(model) -> None:
+    """FP16 и (если установлен optimum) BetterTransformer для инференса на GPU"""
+    model.half()
+    try:
+        from optimum.bettertransformer import BetterTransformer
+        model[0].auto_model = BetterTransformer.transform(model[0].auto_model)
+        logger.info("BetterTransformer enabled for embedding model")
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"BetterTransformer is not applicable: {str(e)}")
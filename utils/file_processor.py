@@ -1,55 +1,62 @@
 import os
 import re
 import json
+import orjson
+import hashlib
 import fitz
 import spacy
-import pytesseract
 import logging
-import camelot
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from PIL import Image
 from io import BytesIO
 from datetime import datetime
-from docx import Document
-from pptx import Presentation
-from openpyxl import load_workbook
 from tqdm import tqdm
 from typing import List, Dict, Optional, Union, Callable
-from sentence_transformers import SentenceTransformer
-from utils.helpers import load_config, normalize_text, generate_unique_id
+from utils.helpers import load_config, normalize_text, generate_unique_id, create_dir
+from utils.embeddings import load_embedding_model
 import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import OrderedDict
+
+try:
+    # Необязательная зависимость: in-process API Tesseract вместо pytesseract
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
 warnings.filterwarnings('ignore', category=FutureWarning)
 
 class FileProcessor:
-    def __init__(self, config):
+    def __init__(self, config, with_embeddings: bool = True):
         self.config = config
         self.logger = logging.getLogger(__name__)
-        self._init_models()
-        self._init_processing_params()
+        self._init_models(with_embeddings)
+        self._init_processing_params(with_embeddings)
         self._init_regex_patterns()
         
-    def _init_models(self):
-        """Инициализация моделей обработки"""
+    def _init_models(self, with_embeddings: bool = True):
+        """Инициализация моделей обработки (без модели эмбеддингов - только разбор файлов)"""
         try:
+            # Нужны только токенизатор и sentencizer: exclude, в отличие от disable,
+            # не читает веса компонентов с диска
             self.nlp = spacy.load(
                 self.config['processing']['spacy_model'],
-                disable=["parser", "lemmatizer", "ner"]
+                exclude=["tok2vec", "morphologizer", "tagger", "parser", "senter",
+                         "attribute_ruler", "lemmatizer", "ner"]
             )
             self.nlp.add_pipe('sentencizer')
             
-            self.embedding_model = SentenceTransformer(
-                self.config['processing']['embedding_model'],
-                device=self.config['processing']['device']
-            )
+            self.embedding_model = load_embedding_model(self.config) if with_embeddings else None
             self.logger.info("Models loaded successfully")
         except Exception as e:
             self.logger.error(f"Model loading error: {str(e)}", exc_info=True)
             raise
 
-    def _init_processing_params(self):
+    def _init_processing_params(self, with_embeddings: bool = True):
         """Инициализация параметров обработки из конфига"""
         processing_cfg = self.config['processing']
         self.chunk_size = processing_cfg['chunk_size']
@@ -59,10 +66,28 @@ class FileProcessor:
         self.min_similarity = processing_cfg['min_similarity']
         self.use_ocr = self.config['ocr']['enabled']
         self.ocr_languages = "+".join(self.config['ocr']['languages'])
+        self.ocr_dpi = self.config['ocr'].get('dpi', 300)
+        self.ocr_min_image_size = self.config['ocr'].get('min_image_size', 50)
+        self._ocr_local = threading.local()
+        self.num_workers = processing_cfg.get('num_workers', 4)
+        # Пул OCR живет вместе с процессором, поэтому экземпляры Tesseract в потоках
+        # переиспользуются между документами. В рабочем процессе пула файлов
+        # (with_embeddings=False) параллелизм уже дают процессы - один поток
+        self._ocr_pool = ThreadPoolExecutor(
+            max_workers=self.num_workers if with_embeddings else 1,
+            thread_name_prefix="ocr"
+        )
+        self.spacy_batch_size = processing_cfg.get('spacy_batch_size', 64)
         self.extract_tables = self.config['tables']['enabled']
         self.max_table_size = self.config['tables']['max_table_size']
         self.table_format = self.config['tables']['format']
         self.max_file_size_mb = processing_cfg['max_file_size_mb']
+        self.supported_formats = tuple(processing_cfg['supported_formats'])
+        self.default_language = processing_cfg.get('default_language', 'ru')
+        self._processing_date = datetime.now().strftime('%Y-%m-%d')
+        # LRU-кэш эмбеддингов по sha1 текста чанка (модель в процессе одна)
+        self._embedding_cache = OrderedDict()
+        self.embedding_cache_size = self.config['performance'].get('embedding_cache_size', 10000)
 
     def _init_regex_patterns(self):
         """Инициализация regex-паттернов из конфига"""
@@ -95,6 +120,8 @@ class FileProcessor:
             return []
 
         file_id = self._generate_file_id(file_path)
+        # Дата обработки одинакова для всех чанков файла
+        self._processing_date = datetime.now().strftime('%Y-%m-%d')
         return processor(file_path, file_id)
 
     def _get_processor(self, file_ext: str) -> Optional[Callable]:
@@ -120,7 +147,9 @@ class FileProcessor:
 
     def _process_pdf(self, file_path: str, file_id: str) -> List[Dict]:
         """Обработка PDF файлов"""
-        chunks = []
+        # Части результата по порядку страниц: списки чанков или Future с результатами OCR
+        parts = []
+        page_texts = []
         current_chapter = ""
         current_section = ""
 
@@ -134,18 +163,28 @@ class FileProcessor:
                 # Обработка текста
                 text = page.get_text("text")
                 if text.strip():
-                    chunks.extend(self._process_text_content(
-                        text, file_id, page_num, "text", current_chapter, current_section
-                    ))
+                    # Место в parts заполняется после пакетной обработки всех страниц
+                    page_texts.append((len(parts), (text, page_num, "text", current_chapter, current_section)))
+                    parts.append(None)
 
-                # Обработка изображений (OCR)
+                # Обработка изображений (OCR): объекты fitz не потокобезопасны, поэтому
+                # изображения извлекаются здесь, а распознаются параллельно в пуле потоков
                 if self.use_ocr:
-                    chunks.extend(self._process_pdf_images(page, file_id, page_num))
+                    images = self._extract_pdf_images(page)
+                    if images:
+                        parts.append(self._ocr_pool.submit(self._process_pdf_images, images, file_id, page_num))
 
                 # Извлечение таблиц
                 if self.extract_tables:
-                    chunks.extend(self._extract_tables_from_pdf(file_path, page_num+1, file_id))
+                    parts.append(self._extract_tables_from_pdf(file_path, page_num+1, file_id))
+
+            text_chunks = self._process_text_contents([item for _, item in page_texts], file_id)
+            for (part_index, _), page_chunks in zip(page_texts, text_chunks):
+                parts[part_index] = page_chunks
 
+        chunks = []
+        for part in parts:
+            chunks.extend(part.result() if isinstance(part, Future) else part)
         return chunks
 
     def _update_sections_from_toc(self, toc: List, page_num: int, current_chapter: str, current_section: str) -> tuple:
@@ -165,6 +204,7 @@ class FileProcessor:
         current_section = ""
         
         try:
+            from docx import Document
             doc = Document(file_path)
             full_text = []
 
@@ -201,7 +241,9 @@ class FileProcessor:
         chunks = []
         
         try:
+            from pptx import Presentation
             prs = Presentation(file_path)
+            slide_texts = []
             
             for slide_num, slide in enumerate(prs.slides):
                 slide_text = []
@@ -213,9 +255,10 @@ class FileProcessor:
                             slide_text.append(text)
                 
                 if slide_text:
-                    chunks.extend(self._process_text_content(
-                        "\n".join(slide_text), file_id, slide_num, "slide", "", ""
-                    ))
+                    slide_texts.append(("\n".join(slide_text), slide_num, "slide", "", ""))
+
+            for slide_chunks in self._process_text_contents(slide_texts, file_id):
+                chunks.extend(slide_chunks)
                     
         except Exception as e:
             self.logger.error(f"Error processing PPTX {file_path}: {str(e)}")
@@ -227,6 +270,7 @@ class FileProcessor:
         chunks = []
         
         try:
+            from openpyxl import load_workbook
             wb = load_workbook(file_path, read_only=True)
             
             for sheet_name in wb.sheetnames:
@@ -268,6 +312,20 @@ class FileProcessor:
         
         return []
 
+    def _process_text_contents(self, items: List[tuple], file_id: str) -> List[List[Dict]]:
+        """Пакетная обработка текстов (text, page, content_type, chapter, section) через nlp.pipe"""
+        if not self.smart_chunking:
+            return [
+                self._process_text_content(text, file_id, page, content_type, chapter, section)
+                for text, page, content_type, chapter, section in items
+            ]
+
+        docs = self.nlp.pipe((item[0] for item in items), batch_size=self.spacy_batch_size)
+        return [
+            self._split_text_into_chunks(text, file_id, page, content_type, chapter, section, doc=doc)
+            for (text, page, content_type, chapter, section), doc in zip(items, docs)
+        ]
+
     def _process_text_content(self, text: str, file_id: str, page: int, 
                             content_type: str, chapter: str, section: str) -> List[Dict]:
         """Обработка текстового контента с разделением на чанки"""
@@ -285,11 +343,14 @@ class FileProcessor:
             )]
 
     def _split_text_into_chunks(self, text: str, file_id: str, page: int, 
-                              content_type: str, chapter: str, section: str) -> List[Dict]:
-        """Умное разделение текста на чанки с контекстом"""
-        doc = self.nlp(text)
+                              content_type: str, chapter: str, section: str, doc=None) -> List[Dict]:
+        """Умное разделение текста на чанки с контекстом (doc - уже разобранный spaCy текст)"""
+        if doc is None:
+            doc = self.nlp(text)
         chunks = []
         current_chunk = []
+        # Число слов каждого предложения текущего чанка (параллельно current_chunk)
+        current_lengths = []
         current_length = 0
         
         for sent in doc.sents:
@@ -301,11 +362,20 @@ class FileProcessor:
             
             if current_length + sent_length > self.chunk_size and current_chunk:
                 self._save_chunk(current_chunk, file_id, page, content_type, chapter, section, chunks)
-                overlap_size = min(self.chunk_overlap, len(current_chunk))
-                current_chunk = current_chunk[-overlap_size:]
-                current_length = sum(len(s.split()) for s in current_chunk)
+                # Перекрытие: последние предложения, суммарно не больше chunk_overlap слов
+                overlap_count = 0
+                overlap_length = 0
+                for length in reversed(current_lengths):
+                    if overlap_length + length > self.chunk_overlap:
+                        break
+                    overlap_length += length
+                    overlap_count += 1
+                current_chunk = current_chunk[len(current_chunk) - overlap_count:]
+                current_lengths = current_lengths[len(current_lengths) - overlap_count:]
+                current_length = overlap_length
             
             current_chunk.append(sent_text)
+            current_lengths.append(sent_length)
             current_length += sent_length
         
         if current_chunk:
@@ -374,6 +444,8 @@ class FileProcessor:
 
         chunks = []
         try:
+            # camelot тянет за собой opencv и ghostscript - импортируем только при извлечении таблиц
+            import camelot
             tables = camelot.read_pdf(
                 file_path,
                 pages=str(page),
@@ -469,19 +541,43 @@ class FileProcessor:
             self.logger.error(f"Table formatting error: {str(e)}")
             return f"Failed to process table {table_num}. Text:\n{df.to_string()}"
 
-    def _process_pdf_images(self, page, file_id: str, page_num: int) -> List[Dict]:
+    def _extract_pdf_images(self, page) -> List[tuple]:
+        """Извлекает изображения страницы PDF для OCR"""
+        images = []
+        for img_index, img in enumerate(page.get_images(full=True), 1):
+            # Иконки, линии и мелкие логотипы не содержат читаемого текста:
+            # размер известен из таблицы изображений без их декодирования
+            if min(img[2], img[3]) < self.ocr_min_image_size:
+                continue
+            try:
+                base_image = page.parent.extract_image(img[0])
+                images.append((img_index, base_image["image"], self._effective_image_dpi(page, img)))
+            except Exception as e:
+                self.logger.warning(f"Image extraction error: {str(e)}")
+        return images
+
+    def _effective_image_dpi(self, page, img: tuple) -> float:
+        """Фактическое разрешение изображения на странице: пиксели на дюйм области размещения.
+        Поле xres - лишь метаданные файла изображения (часто 0, 72 или 96)"""
+        try:
+            placed_width = max((rect.width for rect in page.get_image_rects(img[0])), default=0)
+        except Exception:
+            return 0
+        if placed_width <= 0:
+            return 0
+        return img[2] / (placed_width / 72)
+
+    def _process_pdf_images(self, images: List[tuple], file_id: str, page_num: int) -> List[Dict]:
         """Обработка изображений в PDF через OCR"""
         if not self.use_ocr:
             return []
 
         chunks = []
-        image_list = page.get_images(full=True)
         
-        for img_index, img in enumerate(image_list, 1):
+        for img_index, image_bytes, dpi in images:
             try:
-                base_image = page.extract_image(img[0])
-                image = Image.open(BytesIO(base_image["image"]))
-                ocr_text = pytesseract.image_to_string(image, lang=self.ocr_languages)
+                image = self._prepare_ocr_image(Image.open(BytesIO(image_bytes)), dpi)
+                ocr_text = self._ocr_image(image)
                 
                 if ocr_text.strip():
                     chunks.append(self._create_chunk(
@@ -496,6 +592,34 @@ class FileProcessor:
         
         return chunks
 
+    def _prepare_ocr_image(self, image: Image.Image, dpi: float) -> Image.Image:
+        """Оттенки серого и уменьшение до ocr.dpi: время Tesseract растет с числом пикселей.
+        Сначала перевод в 'L': для режимов '1' и 'P' resize использует NEAREST и теряет тонкие
+        штрихи, а RGB пересчитывался бы по трем каналам вместо одного"""
+        image = image.convert('L')
+        if dpi and dpi > self.ocr_dpi:
+            scale = self.ocr_dpi / dpi
+            image = image.resize(
+                (max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                Image.LANCZOS
+            )
+        return image
+
+    def _ocr_image(self, image: Image.Image) -> str:
+        """Распознает текст на изображении"""
+        if tesserocr is None:
+            import pytesseract
+            return pytesseract.image_to_string(image, lang=self.ocr_languages)
+
+        # Экземпляр Tesseract создается один раз на поток и переиспользуется,
+        # вместо запуска процесса tesseract с загрузкой языковых моделей на каждое изображение
+        api = getattr(self._ocr_local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.ocr_languages)
+            self._ocr_local.api = api
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
     def _create_chunk(self, text: str, file_id: str, page: int, content_type: str,
                     chapter: str = "", section: str = "", chunk_order: int = 0) -> Dict:
         """Создает структурированный чанк"""
@@ -512,15 +636,15 @@ class FileProcessor:
             "embedding": None,
             "metadata": {
                 "file_id": file_id,
-                "source": file_id if file_id.endswith(tuple(self.config['processing']['supported_formats'])) else os.path.basename(file_id),
+                "source": file_id if file_id.endswith(self.supported_formats) else os.path.basename(file_id),
                 "page": page,
                 "type": content_type,
                 "chapter": chapter,
                 "section": section,
                 "chunk_order": chunk_order,
-                "processing_date": datetime.now().strftime('%Y-%m-%d'),
+                "processing_date": self._processing_date,
                 "text_length": len(text),
-                "language": self.config['processing'].get('default_language', 'ru')
+                "language": self.default_language
             }
         }
 
@@ -530,31 +654,59 @@ class FileProcessor:
             return []
         
         try:
-            texts = [chunk['text'] for chunk in chunks]
-            embeddings = self.embedding_model.encode(
-                texts,
-                batch_size=self.config['performance']['embedding_batch_size'],
-                show_progress_bar=False
-            )
-            
-            for chunk, embedding in zip(chunks, embeddings):
-                # Проверяем на NaN перед сохранением
-                if not any(np.isnan(x) for x in embedding):
-                    chunk['embedding'] = embedding.tolist()
+            keys = [hashlib.sha1(chunk['text'].encode('utf-8')).digest() for chunk in chunks]
+
+            # Кодируем только уникальные тексты, которых нет в кэше
+            missing = {}
+            for key, chunk in zip(keys, chunks):
+                if key not in self._embedding_cache and key not in missing:
+                    missing[key] = chunk['text']
+
+            computed = {}
+            if missing:
+                embeddings = self.embedding_model.encode(
+                    list(missing.values()),
+                    batch_size=self.config['performance']['embedding_batch_size'],
+                    show_progress_bar=False,
+                    convert_to_numpy=True
+                )
+                # Проверка на NaN выполняется для всей матрицы сразу; в кэше строки
+                # хранятся как float32 (~3 КБ на 768 значений вместо ~24 КБ списка)
+                embeddings = np.asarray(embeddings, dtype=np.float32)
+                valid = ~np.isnan(embeddings).any(axis=1)
+                for key, embedding, is_valid in zip(missing, embeddings, valid):
+                    computed[key] = embedding if is_valid else None
+
+            for key, chunk in zip(keys, chunks):
+                if key in computed:
+                    embedding = computed[key]
                 else:
+                    embedding = self._embedding_cache[key]
+                    self._embedding_cache.move_to_end(key)
+                if embedding is None:
                     self.logger.warning(f"NaN values in embedding for chunk: {chunk['id']}")
                     chunk['embedding'] = None
+                else:
+                    chunk['embedding'] = embedding.tolist()
+
+            for key, embedding in computed.items():
+                if embedding is not None:
+                    # Копия, чтобы строка не удерживала всю матрицу батча
+                    self._embedding_cache[key] = embedding.copy()
+            while len(self._embedding_cache) > self.embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
             
             return chunks
         except Exception as e:
             self.logger.error(f"Vectorization error: {str(e)}", exc_info=True)
             return []
 
-    def save_chunks(self, chunks: List[Dict], output_file: str) -> None:
-        """Сохранение чанков в файл"""
+    def save_chunks(self, chunks: List[Dict], output_file: str, vectorize: bool = True) -> None:
+        """Сохранение чанков в файл (vectorize=False - чанки уже векторизованы)"""
         try:
-            chunks = self.vectorize_chunks(chunks)
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            if vectorize:
+                chunks = self.vectorize_chunks(chunks)
+            create_dir(os.path.dirname(output_file))
             
             with open(output_file, 'w', encoding='utf-8') as f:
                 json.dump(chunks, f, ensure_ascii=False, indent=2)
@@ -574,8 +726,8 @@ class FileProcessor:
             for file in os.listdir(processed_dir):
                 if file.endswith('.json') and file != self.config['paths']['global_index_file']:
                     file_path = os.path.join(processed_dir, file)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        chunks = json.load(f)
+                    with open(file_path, 'rb') as f:
+                        chunks = orjson.loads(f.read())
                     
                     if chunks:
                         first_chunk = chunks[0]
@@ -587,7 +739,7 @@ class FileProcessor:
                         })
                         index_data['total_chunks'] += len(chunks)
 
-            os.makedirs(index_dir, exist_ok=True)
+            create_dir(index_dir)
             index_file = os.path.join(index_dir, self.config['paths']['global_index_file'])
             with open(index_file, 'w', encoding='utf-8') as f:
                 json.dump(index_data, f, ensure_ascii=False, indent=4)
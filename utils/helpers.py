@@ -8,10 +8,49 @@ import logging
 import platform
 import uuid
 import numpy as np
-from logging.handlers import RotatingFileHandler
+import queue
+import atexit
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+# Регулярные выражения для normalize_text
+_WHITESPACE_RE = re.compile(r'\s+')
+_NON_TEXT_RE = re.compile(r'[^\w\s.,:;!?()\-—–/]')
+
+# Директории, существование которых уже проверено в этом процессе
+_ensured_dirs = set()
+
+# Фоновый поток, который пишет логи на диск вместо вызывающего кода
+_log_listener: Optional[QueueListener] = None
+
+def _stop_log_listener():
+    """Останавливает фоновую запись логов и закрывает обработчики"""
+    global _log_listener
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    for handler in _log_listener.handlers:
+        handler.close()
+    _log_listener = None
+
+def _use_direct_log_handlers():
+    """В дочернем процессе после fork потока QueueListener нет - пишем напрямую"""
+    if _log_listener is None:
+        return
+    logger = logging.getLogger()
+    for handler in logger.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    for handler in _log_listener.handlers:
+        logger.addHandler(handler)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_use_direct_log_handlers)
+atexit.register(_stop_log_listener)
 
 def setup_logging(log_file=None):
     """Настройка централизованного логирования"""
+    global _log_listener
     try:
         config = load_config()
         log_path = config['paths']['log_file']
@@ -47,10 +86,15 @@ def setup_logging(log_file=None):
         # Очистка старых обработчиков
         for handler in logger.handlers[:]:
             logger.removeHandler(handler)
+        _stop_log_listener()
 
-        # Добавление обработчиков
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        # Запись на диск выполняется в фоновом потоке, логгер только кладет записи в очередь
+        log_queue = queue.SimpleQueue()
+        _log_listener = QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        _log_listener.start()
+        logger.addHandler(QueueHandler(log_queue))
 
         logger.info(f"Логгер успешно инициализирован, файл логов: {os.path.abspath(log_path)}")
         return True
@@ -63,7 +107,9 @@ def windows_path(path):
         return os.path.normpath(path)
     return path
 
+@lru_cache(maxsize=1)
 def load_config(config_path="config.yaml"):
+    """Загружает config.yaml; результат кэшируется, словарь не следует изменять"""
     try:
         with open(windows_path(config_path), 'r', encoding='utf-8') as f:
             config = yaml.safe_load(f)
@@ -74,15 +120,19 @@ def load_config(config_path="config.yaml"):
         raise
 
 def normalize_text(text):
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'[^\w\s.,:;!?()\-—–/]', '', text)
+    text = _WHITESPACE_RE.sub(' ', text)
+    text = _NON_TEXT_RE.sub('', text)
     return text.strip()
 
 def create_dir(path):
+    """Создает директорию; уже проверенные пути повторно не проверяются"""
     path = windows_path(path)
-    if path and path != '' and not os.path.exists(path):
-        os.makedirs(path)
+    if not path or path in _ensured_dirs:
+        return
+    if not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
         logging.info(f"Created directory: {path}")
+    _ensured_dirs.add(path)
 
 def generate_unique_id():
     return str(uuid.uuid4())
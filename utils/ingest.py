@@ -1,12 +1,45 @@
 import os
-import json
+import multiprocessing
+import orjson
 from tqdm import tqdm
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
+from qdrant_client.models import PointStruct, OptimizersConfigDiff
 from utils.helpers import load_config, setup_logging
 from utils.helpers import clear_directory
+from utils.vector_store import create_qdrant_client, recreate_collection
 import logging
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Tuple
+
+def load_chunk_file(file_path: str) -> Tuple[List[Dict], np.ndarray]:
+    """Читает файл чанков: чанки без эмбеддингов и их векторы одной матрицей float32"""
+    with open(file_path, 'rb') as f:
+        chunks = orjson.loads(f.read())
+    if not isinstance(chunks, list):  # например, processing_info.json
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    chunks = [chunk for chunk in chunks if chunk.get('embedding') is not None]
+    if not chunks:
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    # Матрица float32 в 4 байта на значение вместо объектов float и дешево передается из процесса
+    vectors = np.asarray([chunk.pop('embedding') for chunk in chunks], dtype=np.float32)
+    valid = ~np.isnan(vectors).any(axis=1)
+    return [chunk for chunk, ok in zip(chunks, valid) if ok], vectors[valid]
+
+def iter_loaded(executor: ProcessPoolExecutor, file_paths: List[str], window: int):
+    """Разбирает файлы в пуле, держа в работе не больше window файлов. В отличие от
+    Executor.map, результаты не копятся в памяти, пока загрузка в Qdrant отстает от разбора"""
+    paths = iter(file_paths)
+    pending = deque(executor.submit(load_chunk_file, path) for path in islice(paths, window))
+    while pending:
+        result = pending.popleft().result()
+        next_path = next(paths, None)
+        if next_path is not None:
+            pending.append(executor.submit(load_chunk_file, next_path))
+        yield result
 
 def main() -> int:
     """Основная функция загрузки данных в Qdrant"""
@@ -16,10 +49,7 @@ def main() -> int:
     perf_config = config.get('performance', {})
     
     try:
-        client = QdrantClient(
-            host=config['qdrant']['host'],
-            port=config['qdrant']['port']
-        )
+        client = create_qdrant_client(config)
         
         # Создаем коллекцию (если не существует)
         try:
@@ -27,66 +57,125 @@ def main() -> int:
             logging.info("Collection already exists")
         except Exception as e:
             logging.warning(f"Collection not found, creating new: {str(e)}")
-            client.recreate_collection(
-                collection_name=config['qdrant']['collection_name'],
-                vectors_config=VectorParams(
-                    size=config['qdrant']['vector_size'],
-                    distance=Distance.COSINE
-                )
-            )
+            recreate_collection(client, config)
             logging.info("Collection created successfully")
         
-        points = []
-        processed_files = 0
+        file_paths = [
+            os.path.join(processed_dir, file) for file in os.listdir(processed_dir)
+            if file.endswith('.json') and file != 'global_index.json'
+        ]
+        processed_files = len(file_paths)
         
-        for file in os.listdir(processed_dir):
-            if file.endswith('.json') and file != 'global_index.json':
-                file_path = os.path.join(processed_dir, file)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    chunks = json.load(f)
-                    for chunk in chunks:
-                        if 'embedding' in chunk and chunk['embedding'] is not None:
-                            # Проверка на NaN
-                            if not any(np.isnan(x) for x in chunk['embedding']):
-                                points.append(PointStruct(
-                                    id=chunk['id'],
-                                    vector=chunk['embedding'],
-                                    payload={
-                                        "text": chunk['text'],
-                                        "metadata": chunk['metadata'],
-                                        "vector": chunk['embedding']
-                                    }
-                                ))
-                    processed_files += 1
-        
-        if not points:
+        if not file_paths:
             logging.warning("No data to load")
             return 0
         
         # Используем настройки производительности из конфига
         batch_size = perf_config.get('qdrant_batch_size', 20)
+        max_threads = perf_config.get('max_threads', 4)
+        max_retries = 3
+        collection_name = config['qdrant']['collection_name']
         success_count = 0
-        
-        for i in tqdm(range(0, len(points), batch_size), desc="Загрузка в Qdrant"):
-            batch = points[i:i+batch_size]
+        failed_batches = 0
+
+        def iter_points(loaded):
+            """Точки отдаются по мере разбора файлов, без накопления всего списка в памяти"""
+            for chunks, vectors in loaded:
+                for chunk, vector in zip(chunks, vectors):
+                    yield PointStruct(
+                        id=chunk['id'],
+                        vector=vector.tolist(),
+                        payload={
+                            "text": chunk['text'],
+                            "metadata": chunk['metadata']
+                        }
+                    )
+
+        def upload_batch(batch: List[PointStruct]) -> int:
+            """Отправляет батч с повторами; сервер подтверждает его после записи в WAL"""
+            for attempt in range(1, max_retries + 1):
+                try:
+                    client.upsert(collection_name=collection_name, points=batch, wait=False)
+                    return len(batch)
+                except Exception as e:
+                    if attempt == max_retries:
+                        raise
+                    logging.warning(f"Batch upload attempt {attempt} failed, retrying: {str(e)}")
+
+        def collect(future) -> None:
+            """Учитывает результат батча; ошибка одного батча не прерывает загрузку остальных"""
+            nonlocal success_count, failed_batches
             try:
-                operation_result = client.upsert(
-                    collection_name=config['qdrant']['collection_name'],
-                    points=batch,
-                    wait=True
-                )
-                
-                if operation_result.status == 'completed':
-                    success_count += len(batch)
-                else:
-                    logging.error(f"Batch {i//batch_size} failed: {operation_result.status}")
-                    batch_size = max(1, batch_size // 2)
+                success_count += future.result()
             except Exception as e:
-                logging.error(f"Batch {i//batch_size} error: {str(e)}")
-                batch_size = max(1, batch_size // 2)
+                failed_batches += 1
+                logging.error(f"Batch error: {str(e)}")
+
+        # На время массовой загрузки индексация отключается: HNSW строится один раз после,
+        # а не дополняется при каждой вставке. После загрузки восстанавливается значение из
+        # конфига, а не текущее: после прерванной или параллельной загрузки там может остаться 0
+        indexing_threshold = config['qdrant'].get('indexing_threshold', 20000)
+        client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+        )
+
+        # Большие объемы JSON разбираются параллельно в отдельных процессах. Контекст spawn:
+        # ingest вызывается и из потока веб-сервера, а fork многопоточного процесса
+        # (event loop, логирование, torch, канал gRPC) может зависнуть. Для обычных
+        # порций разбор в процессе дешевле запуска пула и передачи результатов обратно
+        executor = None
+        parse_workers = min(len(file_paths), os.cpu_count() or 4)
+        total_mb = sum(os.path.getsize(path) for path in file_paths) / (1024 * 1024)
+        bulk_load = total_mb >= perf_config.get('ingest_parallel_min_mb', 256)
+        if len(file_paths) > 1 and bulk_load:
+            executor = ProcessPoolExecutor(
+                max_workers=parse_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        try:
+            if executor:
+                loaded = iter_loaded(executor, file_paths, window=2 * parse_workers)
+            else:
+                loaded = map(load_chunk_file, file_paths)
+            # Несколько батчей в полете одновременно: пока сервер обрабатывает один, отправляются
+            # следующие. Очередь ограничена, чтобы не собирать в памяти все точки заранее
+            points = iter(tqdm(iter_points(loaded), desc="Загрузка в Qdrant"))
+            in_flight = deque()
+            with ThreadPoolExecutor(max_workers=max_threads) as uploader:
+                while True:
+                    batch = list(islice(points, batch_size))
+                    if not batch:
+                        break
+                    if len(in_flight) >= 2 * max_threads:
+                        collect(in_flight.popleft())
+                    in_flight.append(uploader.submit(upload_batch, batch))
+                while in_flight:
+                    collect(in_flight.popleft())
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            client.update_collection(
+                collection_name=collection_name,
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+            )
+
+        if failed_batches:
+            # Файлы чанков сохраняются для повторной загрузки
+            logging.error(f"{failed_batches} batches failed, {success_count} chunks loaded; "
+                          f"keeping {processed_dir} for retry")
+            return success_count
+
+        if not success_count:
+            logging.warning("No data to load")
+            return 0
+
+        # Одна сверка в конце вместо ожидания применения каждого батча
+        total_points = client.count(collection_name=collection_name, exact=True).count
+        logging.info(f"Collection {collection_name} now holds {total_points} points")
         
         clear_directory(config['paths']['output_dir'])
-        logging.info(f"Successfully loaded {success_count}/{len(points)} chunks from {processed_files} files")
+        logging.info(f"Successfully loaded {success_count} chunks from {processed_files} files")
         return success_count
     
    
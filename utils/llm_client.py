@@ -3,11 +3,26 @@ import httpx
 import logging
 from utils.helpers import load_config
 
+try:
+    # Необязательная зависимость: HTTP/2 в httpx требует пакет h2
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 class LLMClient:
     def __init__(self):
         self.config = load_config().get('llm', {})
         self.logger = logging.getLogger(__name__)
-        self.client = httpx.AsyncClient(timeout=60.0)
+        # Пул соединений переиспользуется между запросами (keep-alive, при наличии h2 - HTTP/2)
+        self.client = httpx.AsyncClient(
+            timeout=60.0,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=self.config.get('max_connections', 64),
+                max_keepalive_connections=self.config.get('max_keepalive_connections', 32)
+            )
+        )
         self._validate_config()
 
     def _validate_config(self):
@@ -15,6 +15,14 @@ from utils.helpers import load_config
 logger = logging.getLogger(__name__)
 config = load_config()
 
+# FileProcessor рабочего процесса: модели загружаются один раз на процесс, а не на файл
+_worker_processor = None
+
+def _init_worker(config: Dict) -> None:
+    """Инициализация рабочего процесса пула (векторизация выполняется в основном процессе)"""
+    global _worker_processor
+    _worker_processor = FileProcessor(config, with_embeddings=False)
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -24,7 +32,7 @@ def process_single_file(args: Tuple[Dict, str]) -> Tuple[str, List[Dict]]:
     """Обработка одного файла с повторными попытками при ошибках."""
     config, file_path = args
     try:
-        processor = FileProcessor(config)
+        processor = _worker_processor or FileProcessor(config, with_embeddings=False)
         chunks = processor.process_file(file_path)
         return (file_path, chunks)
     except Exception as e:
@@ -33,7 +41,6 @@ def process_single_file(args: Tuple[Dict, str]) -> Tuple[str, List[Dict]]:
 
 async def parallel_process(config: Dict) -> Dict[str, List[Dict]]:
     """Асинхронная параллельная обработка файлов."""
-    processor = FileProcessor(config)
     data_dir = config['paths']['data_dir']
     output_dir = config['paths']['output_dir']
     
@@ -60,7 +67,11 @@ async def parallel_process(config: Dict) -> Dict[str, List[Dict]]:
     )
 
     try:
-        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(config,)
+        ) as executor:
             tasks = [(config, fp) for fp in file_paths]
             
             with tqdm(total=len(tasks), desc="Processing files") as pbar:
@@ -73,7 +84,7 @@ async def parallel_process(config: Dict) -> Dict[str, List[Dict]]:
                     try:
                         file_path, chunks = future.result()
                         results[file_path] = chunks
-                        logger.debug(f"Processed {file_path} -> {len(chunks)} chunks")
+                        logger.debug("Processed %s -> %d chunks", file_path, len(chunks))
                     except Exception as e:
                         logger.error(f"Failed to process file: {str(e)}")
                     finally:
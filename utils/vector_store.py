@@ -0,0 +1,42 @@
+#utils/vector_store.py
+from typing import Optional
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    VectorParams, Distance, ScalarQuantization, ScalarQuantizationConfig, ScalarType
+)
+
+
+def create_qdrant_client(config: dict, timeout: Optional[int] = None) -> QdrantClient:
+    """Создает клиент Qdrant по секции qdrant из config.yaml (gRPC, если включен)"""
+    qdrant_cfg = config['qdrant']
+    return QdrantClient(
+        host=qdrant_cfg['host'],
+        port=qdrant_cfg['port'],
+        grpc_port=qdrant_cfg.get('grpc_port', 6334),
+        prefer_grpc=qdrant_cfg.get('prefer_grpc', False),
+        timeout=timeout
+    )
+
+
+def recreate_collection(client: QdrantClient, config: dict) -> None:
+    """Создает (пересоздает) коллекцию с параметрами векторов и квантования из config.yaml"""
+    qdrant_cfg = config['qdrant']
+    quantization_config = None
+    if qdrant_cfg.get('scalar_quantization', False):
+        # INT8-копии векторов в RAM в 4 раза меньше float32; оригиналы используются для уточнения
+        quantization_config = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    client.recreate_collection(
+        collection_name=qdrant_cfg['collection_name'],
+        vectors_config=VectorParams(
+            size=qdrant_cfg['vector_size'],
+            distance=Distance.COSINE,
+            on_disk=qdrant_cfg.get('vectors_on_disk', False)
+        ),
+        quantization_config=quantization_config
+    )